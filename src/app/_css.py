@@ -0,0 +1,28 @@
+"""
+_css.py  ·  Shared page styling
+================================
+CSS for the Streamlit pages lives in static/*.css. Page scripts re-execute
+on every rerun, but imported modules do not, so the stylesheets are read
+and assembled into <style> blocks once per process.
+"""
+
+from pathlib import Path
+
+import streamlit as st
+
+_STATIC_DIR = Path(__file__).resolve().parent / "static"
+
+
+def _read_css(*names: str) -> str:
+    """Concatenate stylesheets from static/ into a single <style> block."""
+    css = "".join((_STATIC_DIR / name).read_text(encoding="utf-8") for name in names)
+    return f"<style>{css}</style>"
+
+
+APP_STYLE = _read_css("hide_nav.css", "base.css", "app.css")
+STRESS_STYLE = _read_css("hide_nav.css", "base.css", "stress.css")
+
+
+def inject_css(style: str) -> None:
+    """Emit a prebuilt <style> block for the current page."""
+    st.markdown(style, unsafe_allow_html=True)
@@ -6,19 +6,30 @@ for drug-label evidence retrieval and grounded answers.
 """
 
 import sys
+import time
+from collections import deque
+from itertools import islice
 from pathlib import Path
 
-# ── Make src/ importable so we can reach rag_engine & openfda_rag ──
+# ── Make src/ and src/app/ importable (rag_engine, openfda_rag, _css) ──
 _APP_DIR = Path(__file__).resolve().parent          # src/app/
 _SRC_DIR = _APP_DIR.parent                           # src/
-if str(_SRC_DIR) not in sys.path:
-    sys.path.insert(0, str(_SRC_DIR))
+for _p in (_SRC_DIR, _APP_DIR):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
 
 import streamlit as st
-from datetime import datetime
-import time
 
-from rag_engine import run_rag_query, read_logs
+from rag_engine import LOG_CSV, log_result, run_rag_query, read_logs
+from _css import APP_STYLE, inject_css
+
+# ─── Static HTML fragments ───────────────────────────────────
+_RESPONSE_CARD_HTML = "<div class='card'><div class='card-title response'>Response Panel</div></div>"
+_EVIDENCE_CARD_HTML = "<div class='card'><div class='card-title evidence'>Evidence / Artifacts</div></div>"
+_METRICS_CARD_HTML = "<div class='card'><div class='card-title metrics'>Metrics & Monitoring</div></div>"
+_LOGS_CARD_HTML = "<div class='card'><div class='card-title logs'>Logs</div></div>"
+_RESPONSE_PLACEHOLDER = "Enter a drug-label question in the sidebar and click **Run RAG Query**."
+_EVIDENCE_PLACEHOLDER = "Evidence will appear here after running a query."
 
 # ─── Page config ──────────────────────────────────────────────
 st.set_page_config(
@@ -27,96 +38,86 @@ st.set_page_config(
     layout="wide",
 )
 
-# ─── Hide built-in page nav ──────────────────────────────────
-st.markdown("""
-<style>
-div[data-testid="stSidebarNav"] { display: none !important; }
-section[data-testid="stSidebar"] nav { display: none !important; }
-section[data-testid="stSidebar"] ul[role="list"] { display: none !important; }
-section[data-testid="stSidebar"] > div:first-child { padding-top: 0rem !important; }
-/* Hide the auto-generated page nav links only, not collapse buttons */
-section[data-testid="stSidebar"] ul[data-testid="stSidebarNavItems"] { display: none !important; }
-</style>
-""", unsafe_allow_html=True)
-
-# ─── App styling ──────────────────────────────────────────────
-st.markdown("""<style>
-.main-header-bar {
-    background: linear-gradient(90deg, #F2994A, #EB5757);
-    color: white; padding: 12px 16px; border-radius: 10px;
-    font-weight: 600; margin-bottom: 14px;
-}
-.scenario-card {
-    padding: 10px 12px; border-radius: 10px;
-    margin-bottom: 8px; font-weight: 700; line-height: 1.2;
-}
-.primary-active {
-    background-color: #E8F5E9; border-left: 6px solid #2E7D32;
-}
-.card {
-    background: #FFFFFF; border: 1px solid #E5E7EB;
-    border-radius: 14px; padding: 14px 16px;
-    box-shadow: 0 1px 2px rgba(0,0,0,0.06); margin-bottom: 14px;
-}
-.card-title { font-weight: 800; font-size: 16px; margin-bottom: 8px; }
-.card-title.response { color: #1f7a8c; }
-.card-title.evidence { color: #d35400; }
-.card-title.metrics  { color: #2e7d32; }
-.card-title.logs     { color: #6b7280; }
-.bullets { margin: 0; padding-left: 18px; }
-.bullets li { margin: 6px 0; }
-.pill-link {
-    flex: 1; text-align: center; padding: 14px;
-    border-radius: 14px; border: 1px solid #d1d5db;
-    background: #ffffff; font-weight: 800; color: #111827;
-    text-decoration: none !important;
-    box-shadow: 0 1px 2px rgba(0,0,0,0.06);
-}
-/* Apply custom font but exclude Streamlit icon elements */
-html, body,
-p, h1, h2, h3, h4, h5, h6,
-span, div, li, td, th, label, a,
-input, textarea, select, button,
-.stMarkdown, .stText, .stCaption,
-[data-testid="stMetricValue"],
-[data-testid="stMetricLabel"] {
-    font-family: "Times New Roman", Times, serif !important;
-    line-height: 1.4;
-}
-/* Restore Streamlit's icon font for Material Icons */
-[data-testid="stIconMaterial"],
-.material-symbols-rounded,
-[data-testid="collapsedControl"] span,
-span[class*="icon"] {
-    font-family: "Material Symbols Rounded" !important;
-}
-</style>""", unsafe_allow_html=True)
+# ─── App styling (includes built-in nav hiding) ──────────────
+inject_css(APP_STYLE)
 
 
 # ══════════════════════════════════════════════════════════════
 #  SESSION STATE
 # ══════════════════════════════════════════════════════════════
-if "active_panel" not in st.session_state:
-    st.session_state.active_panel = "ALL"
-if "result" not in st.session_state:
-    st.session_state.result = None
-if "logs" not in st.session_state:
-    st.session_state.logs = []
-
-def set_panel(name: str):
-    st.session_state.active_panel = (
-        "ALL" if st.session_state.active_panel == name else name
-    )
+st.session_state.setdefault("result", None)
+st.session_state.setdefault("logs", deque(maxlen=50))   # newest entries win
+
+
+# ══════════════════════════════════════════════════════════════
+#  CACHED PIPELINE
+# ══════════════════════════════════════════════════════════════
+class _NoEvidence(Exception):
+    """Carries a refusal result out of the cached call so it is not memoized."""
+
+    def __init__(self, result):
+        super().__init__("no evidence")
+        self.result = result
+
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def _cached_rag(query_text: str, method: str, top_k: int):
+    result = run_rag_query(query_text, method=method, top_k=top_k, use_rerank=False, log=False)
+    if not result["evidence"]:
+        # Refusals may come from transient API errors — don't pin them for an hour.
+        raise _NoEvidence(result)
+    return result
+
+
+def rag_query(query_text: str, method: str, top_k: int, gemini_key: str, on_token=None):
+    """
+    Extractive answers are memoized with st.cache_data. Gemini answers stream
+    into the page via on_token, which cannot run inside a cached function
+    (Streamlit won't replay writes to outside placeholders), so they bypass
+    it; rag_engine keeps its own LRU of Gemini answers.
+
+    Cached runs are timed and logged here rather than inside the cache, so
+    every query gets a CSV row and the latency shown is this run's.
+    """
+    if gemini_key:
+        return run_rag_query(
+            query_text,
+            gemini_key=gemini_key,
+            method=method,
+            top_k=top_k,
+            use_rerank=False,
+            on_token=on_token,
+        )
+    t0 = time.time()
+    try:
+        result = _cached_rag(query_text, method, top_k)
+    except _NoEvidence as exc:
+        result = exc.result
+    result = dict(result, latency_ms=round((time.time() - t0) * 1000, 1))
+    log_result(query_text, result)
+    return result
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _cached_log_rows(last_n: int, mtime_ns: int):
+    """Recent CSV log rows; mtime_ns invalidates the entry on every append."""
+    return read_logs(last_n=last_n)
+
+
+def _log_mtime_ns() -> int:
+    try:
+        return LOG_CSV.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
 
 
 # ══════════════════════════════════════════════════════════════
 #  SIDEBAR
 # ══════════════════════════════════════════════════════════════
 st.sidebar.title("Scenario Mode")
-st.sidebar.markdown(
+st.sidebar.html(
     "<div class='scenario-card primary-active'>"
-    "🟢 Primary Demo<br><small>Normal user workflow</small></div>",
-    unsafe_allow_html=True,
+    "🟢 Primary Demo<br><small>Normal user workflow</small></div>"
 )
 if st.sidebar.button("⚠️ Go to Stress Test", key="go_stress"):
     st.switch_page("pages/stress_test.py")
@@ -138,29 +139,33 @@ example = st.sidebar.selectbox("Pick a sample question:", EXAMPLES, index=0)
 
 st.sidebar.subheader("Query Input")
 default_q = "" if example == EXAMPLES[0] else example
-query_text = st.sidebar.text_area(
-    "Enter your drug-label question:",
-    value=default_q,
-    placeholder="e.g. What are the side effects of ibuprofen?",
-    height=100,
-)
 
-# ── Advanced settings (collapsible) ──
-with st.sidebar.expander("Advanced Settings"):
-    method = st.selectbox(
-        "Retrieval method",
-        ["hybrid", "dense", "sparse"],
-        index=0,
-    )
-    top_k = st.slider("Top-K evidence", 3, 10, 5)
-    gemini_key = st.text_input(
-        "Google Gemini API key (optional)",
-        type="password",
-        help="If provided, answers are generated by Gemini 2.0 Flash. "
-             "Otherwise, a rule-based extractive fallback is used.",
+# Inputs are batched in a form so editing them doesn't rerun the page;
+# the example picker stays outside so it can refill the question box.
+with st.sidebar.form("rag_form", border=False):
+    query_text = st.text_area(
+        "Enter your drug-label question:",
+        value=default_q,
+        placeholder="e.g. What are the side effects of ibuprofen?",
+        height=100,
     )
 
-run = st.sidebar.button("🔍 Run RAG Query", type="primary", width="stretch")
+    # ── Advanced settings (collapsible) ──
+    with st.expander("Advanced Settings"):
+        method = st.selectbox(
+            "Retrieval method",
+            ["hybrid", "dense", "sparse"],
+            index=0,
+        )
+        top_k = st.slider("Top-K evidence", 3, 10, 5)
+        gemini_key = st.text_input(
+            "Google Gemini API key (optional)",
+            type="password",
+            help="If provided, answers are generated by Gemini 2.0 Flash. "
+                 "Otherwise, a rule-based extractive fallback is used.",
+        )
+
+    run = st.form_submit_button("🔍 Run RAG Query", type="primary", width="stretch")
 
 st.sidebar.markdown("---")
 if st.sidebar.button("🔄 Reset Session"):
@@ -169,17 +174,34 @@ if st.sidebar.button("🔄 Reset Session"):
 
 
 # ══════════════════════════════════════════════════════════════
-#  RUN LOGIC  (executes BEFORE rendering so state is updated)
+#  RUN LOGIC  (queued here, executed by the dashboard before its panels)
 # ══════════════════════════════════════════════════════════════
 if run and query_text:
+    st.session_state.pending_query = (query_text, method, top_k, gemini_key)
+elif run and not query_text:
+    st.sidebar.warning("Please enter a query first.")
+
+
+def run_pending_query(live=None):
+    """Run a submitted query; Gemini answers stream into `live` when given."""
+    pending = st.session_state.pop("pending_query", None)
+    if pending is None:
+        return
+    query_text, method, top_k, gemini_key = pending
+    from datetime import datetime   # only needed once a query runs
+
+    on_token = None
+    if live is not None:
+        streamed = []
+
+        def on_token(text: str):
+            streamed.append(text)
+            live.markdown("".join(streamed))
+
     with st.spinner("Fetching FDA drug labels and running RAG pipeline..."):
-        result = run_rag_query(
-            query_text,
-            gemini_key=gemini_key,
-            method=method,
-            top_k=top_k,
-            use_rerank=False,
-        )
+        result = rag_query(query_text, method, top_k, gemini_key, on_token=on_token)
+    if live is not None:
+        live.empty()
     st.session_state.result = result
 
     # Store for stress-test comparison page
@@ -196,35 +218,22 @@ if run and query_text:
         f"Confidence: {result['confidence']:.0%}"
     )
 
-elif run and not query_text:
-    st.sidebar.warning("Please enter a query first.")
-
 
 # ══════════════════════════════════════════════════════════════
 #  MAIN HEADER
 # ══════════════════════════════════════════════════════════════
 st.markdown("## TruPharma GenAI Assistant")
-st.markdown(
-    "<div class='main-header-bar'>Prototype Primary Demo — Drug Label Evidence RAG</div>",
-    unsafe_allow_html=True,
+st.html(
+    "<div class='main-header-bar'>Prototype Primary Demo — Drug Label Evidence RAG</div>"
 )
 
-# ── Pill row ──
-c1, c2, c3, c4 = st.columns(4, gap="small")
-c1.button("Response", width="stretch",
-           type="primary" if st.session_state.active_panel == "Response" else "secondary",
-           key="pill_response", on_click=set_panel, args=("Response",))
-c2.button("Evidence / Artifacts", width="stretch",
-           type="primary" if st.session_state.active_panel == "Evidence" else "secondary",
-           key="pill_evidence", on_click=set_panel, args=("Evidence",))
-c3.button("Metrics & Monitoring", width="stretch",
-           type="primary" if st.session_state.active_panel == "Metrics" else "secondary",
-           key="pill_metrics", on_click=set_panel, args=("Metrics",))
-c4.button("Logs", width="stretch",
-           type="primary" if st.session_state.active_panel == "Logs" else "secondary",
-           key="pill_logs", on_click=set_panel, args=("Logs",))
-
-st.caption("Click a pill to focus; click again to return to the full dashboard view.")
+# ── Pill row options (rendered by render_dashboard) ──
+PANEL_LABELS = {
+    "Response": "Response",
+    "Evidence": "Evidence / Artifacts",
+    "Metrics": "Metrics & Monitoring",
+    "Logs": "Logs",
+}
 
 
 # ══════════════════════════════════════════════════════════════
@@ -232,45 +241,42 @@ st.caption("Click a pill to focus; click again to return to the full dashboard v
 # ══════════════════════════════════════════════════════════════
 
 def render_response():
-    st.markdown(
-        "<div class='card'><div class='card-title response'>Response Panel</div>",
-        unsafe_allow_html=True,
-    )
+    st.html(_RESPONSE_CARD_HTML)
+    run_pending_query(live=st.empty())
     r = st.session_state.result
     if not r:
-        st.info("Enter a drug-label question in the sidebar and click **Run RAG Query**.")
+        st.info(_RESPONSE_PLACEHOLDER)
     else:
-        st.markdown(f"**Confidence:** {r['confidence']:.0%}")
         llm_label = "Gemini 2.0 Flash" if r["llm_used"] else "Extractive fallback"
-        st.markdown(f"**Generator:** {llm_label}")
-        st.markdown("---")
-        st.markdown(r["answer"])
-    st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown(
+            f"**Confidence:** {r['confidence']:.0%}\n\n"
+            f"**Generator:** {llm_label}\n\n"
+            "---\n\n"
+            f"{r['answer']}"
+        )
 
 
 def render_evidence():
-    st.markdown(
-        "<div class='card'><div class='card-title evidence'>Evidence / Artifacts</div>",
-        unsafe_allow_html=True,
-    )
+    st.html(_EVIDENCE_CARD_HTML)
     r = st.session_state.result
     if not r or not r["evidence"]:
-        st.info("Evidence will appear here after running a query.")
+        st.info(_EVIDENCE_PLACEHOLDER)
     else:
-        for i, ev in enumerate(r["evidence"], 1):
-            with st.expander(f"Evidence {i}  ·  {ev['cite']}  ·  field: {ev['field']}"):
-                st.markdown(f"**Document:** `{ev['doc_id']}`")
-                st.markdown(f"**Field:** `{ev['field']}`")
-                st.markdown("**Content:**")
-                st.text(ev["content"][:600])
-    st.markdown("</div>", unsafe_allow_html=True)
+        rows = [
+            {
+                "#": i,
+                "Citation": ev["cite"],
+                "Document": ev["doc_id"],
+                "Field": ev["field"],
+                "Content": ev["content"][:600],
+            }
+            for i, ev in enumerate(r["evidence"], 1)
+        ]
+        st.dataframe(rows, width="stretch", hide_index=True)
 
 
 def render_metrics():
-    st.markdown(
-        "<div class='card'><div class='card-title metrics'>Metrics & Monitoring</div>",
-        unsafe_allow_html=True,
-    )
+    st.html(_METRICS_CARD_HTML)
     r = st.session_state.result
     if r:
         m1, m2, m3, m4 = st.columns(4)
@@ -279,42 +285,34 @@ def render_metrics():
         m3.metric("Confidence", f"{r['confidence']:.0%}")
         m4.metric("Records Fetched", r["num_records"])
 
-        st.markdown(f"- **Retrieval method:** {r['method']}")
-        st.markdown(f"- **LLM used:** {'Gemini 2.0 Flash' if r['llm_used'] else 'Extractive fallback'}")
-        st.markdown(f"- **openFDA search:** `{r['search_query'][:120]}`")
-        st.markdown(f"- **Errors / Fallbacks:** None")
+        st.markdown(
+            f"- **Retrieval method:** {r['method']}\n"
+            f"- **LLM used:** {'Gemini 2.0 Flash' if r['llm_used'] else 'Extractive fallback'}\n"
+            f"- **openFDA search:** `{r['search_query'][:120]}`\n"
+            "- **Errors / Fallbacks:** None"
+        )
     else:
         st.info("Run a query to see metrics.")
-    st.markdown("</div>", unsafe_allow_html=True)
 
 
 def render_logs():
-    st.markdown(
-        "<div class='card'><div class='card-title logs'>Logs</div>",
-        unsafe_allow_html=True,
-    )
+    st.html(_LOGS_CARD_HTML)
 
     # Session logs (in-memory)
-    st.markdown("**Session Log**")
     if not st.session_state.logs:
-        st.write("No queries run yet this session.")
+        st.markdown("**Session Log**\n\nNo queries run yet this session.")
     else:
-        for line in reversed(st.session_state.logs[-10:]):
-            st.write(line)
+        lines = "\n\n".join(islice(reversed(st.session_state.logs), 10))
+        st.markdown(f"**Session Log**\n\n{lines}")
 
     # CSV log (persistent)
-    st.markdown("---")
-    st.markdown("**Product Metrics CSV** (`logs/product_metrics.csv`)")
-    csv_rows = read_logs(last_n=10)
+    st.markdown("---\n\n**Product Metrics CSV** (`logs/product_metrics.csv`)")
+    csv_rows = _cached_log_rows(10, _log_mtime_ns())
     if csv_rows:
-        import pandas as pd
-        df = pd.DataFrame(csv_rows)
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        st.dataframe(csv_rows, width="stretch", hide_index=True)
     else:
         st.write("No CSV log entries yet.")
 
-    st.markdown("</div>", unsafe_allow_html=True)
-
 
 def render_overall():
     left, right = st.columns([2.2, 1.2], gap="large")
@@ -329,15 +327,31 @@ def render_overall():
 # ══════════════════════════════════════════════════════════════
 #  CONDITIONAL VIEWS
 # ══════════════════════════════════════════════════════════════
-active = st.session_state.active_panel
-
-if active == "ALL":
-    render_overall()
-elif active == "Response":
-    render_response()
-elif active == "Evidence":
-    render_evidence()
-elif active == "Metrics":
-    render_metrics()
-elif active == "Logs":
-    render_logs()
+@st.fragment
+def render_dashboard():
+    """Pill row + selected panels; switching pills reruns only this fragment."""
+    active_panel = st.segmented_control(
+        "View",
+        list(PANEL_LABELS),
+        format_func=PANEL_LABELS.get,
+        key="active_panel",
+        label_visibility="collapsed",
+    )
+    st.caption("Click a pill to focus; click again to return to the full dashboard view.")
+
+    active = active_panel or "ALL"
+    if active not in ("ALL", "Response"):
+        run_pending_query()   # no Response card to stream into
+    if active == "ALL":
+        render_overall()
+    elif active == "Response":
+        render_response()
+    elif active == "Evidence":
+        render_evidence()
+    elif active == "Metrics":
+        render_metrics()
+    elif active == "Logs":
+        render_logs()
+
+
+render_dashboard()
@@ -3,21 +3,26 @@ openfda_rag.py
 API-first helpers for building a lightweight RAG pipeline over openFDA drug labels.
 """
 
+import gzip
 import json
+import zlib
 import os
 import re
 import html
 import time
 import pickle
-import urllib.error
-import urllib.parse
-import urllib.request
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import normalize
 
 import faiss
 from rank_bm25 import BM25Okapi
@@ -27,6 +32,13 @@ try:
 except Exception:
     SentenceTransformer = None
 
+# orjson decodes large label payloads several times faster than the stdlib;
+# its JSONDecodeError subclasses json.JSONDecodeError, so callers are unchanged.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
 # Cache SentenceTransformer models so they are loaded only once
 _ST_MODEL_CACHE: Dict = {}
 
@@ -40,6 +52,20 @@ def _get_st_model(model_name: str):
 OPENFDA_BASE_URL = "https://api.fda.gov/drug/label.json"
 OPENFDA_MAX_LIMIT = 1000
 
+# Optional on-disk response cache: set OPENFDA_CACHE_DIR to enable.
+# Label data changes on a scale of days, so re-runs can skip the network.
+OPENFDA_CACHE_DIR = os.environ.get("OPENFDA_CACHE_DIR") or None
+OPENFDA_CACHE_TTL_S = float(os.environ.get("OPENFDA_CACHE_TTL_S", 7 * 24 * 3600))
+
+# In-process memo of recent raw responses (always on; 0 disables). Repeated
+# queries in a long-running app reuse them without touching disk or network.
+OPENFDA_MEMO_SIZE = int(os.environ.get("OPENFDA_MEMO_SIZE", 16))
+OPENFDA_MEMO_TTL_S = 3600.0
+
+# Client-side pacing for real network calls (openFDA allows 240 requests/min
+# per IP). Cache hits are never delayed. 0 disables.
+OPENFDA_MAX_RPS = float(os.environ.get("OPENFDA_MAX_RPS", 4.0))
+
 
 @dataclass
 class TextChunk:
@@ -57,10 +83,16 @@ class SubChunk:
     text: str
 
 
+# Compiled once; these run for every label field and every chunk.
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"[a-zA-Z0-9]+")
+
+
 def clean_text(text: str) -> str:
-    text = re.sub(r"<[^>]+>", " ", text)
+    text = _TAG_RE.sub(" ", text)
     text = html.unescape(text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = _WS_RE.sub(" ", text).strip()
     return text
 
 
@@ -77,7 +109,7 @@ def normalize_field_value(value: Any) -> str:
 
 def pick_text_fields(
     record: Dict[str, Any],
-    field_allowlist: Optional[List[str]],
+    field_allowlist: Optional[Iterable[str]],
     field_blocklist: Iterable[str],
     include_table_fields: bool,
 ) -> Dict[str, str]:
@@ -124,7 +156,8 @@ def fixed_size_chunk(text: str, words_per_chunk: int, overlap: int) -> List[str]
 
 
 def tokenize(text: str) -> List[str]:
-    return [t.lower() for t in re.findall(r"[a-zA-Z0-9]+", text)]
+    # Lowercase the whole string once rather than each token.
+    return _TOKEN_RE.findall(text.lower())
 
 
 def build_openfda_query(
@@ -148,34 +181,190 @@ def build_openfda_query(
     return " AND ".join(groups)
 
 
-def _openfda_request(
-    base_url: str, params: Dict[str, Any], timeout_s: int = 30
-) -> Dict[str, Any]:
-    query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
-    url = f"{base_url}?{query}" if query else base_url
-    req = urllib.request.Request(url, headers={"User-Agent": "Week4-Assignment-RAG/1.0"})
+class _CappedRetry(Retry):
+    """Retry that honours Retry-After but never sleeps longer than max_retry_after."""
+
+    max_retry_after = 5.0
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.max_retry_after)
+
+
+def _make_session(pool_size: int = 16, retries: int = 3) -> requests.Session:
+    """
+    Shared keep-alive session so page requests reuse pooled TLS connections.
+    Rate-limit (429) and transient 5xx responses are retried with exponential
+    backoff, honouring Retry-After (capped at a few seconds) when openFDA
+    sends it. Read timeouts are not retried, so a hung endpoint costs one
+    timeout rather than one per attempt.
+    """
+    session = requests.Session()
+    session.headers["User-Agent"] = "Week4-Assignment-RAG/1.0"
+    retry = _CappedRetry(
+        total=retries,
+        connect=1,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_HTTP_SESSION = _make_session()
+
+
+class _TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a request may go out."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Reserve a token now (possibly going negative) so concurrent
+            # callers queue up behind each other instead of all waking at once.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+_RATE_LIMITER = _TokenBucket(OPENFDA_MAX_RPS, burst=int(OPENFDA_MAX_RPS) or 1)
+
+
+def _cache_key(base_url: str, params: Dict[str, Any]) -> str:
+    """Stable digest of a request; the API key is not part of the key."""
+    key_params = sorted((k, str(v)) for k, v in params.items() if k != "api_key")
+    key = json.dumps([base_url, key_params])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _cache_path(digest: str) -> str:
+    return os.path.join(OPENFDA_CACHE_DIR, f"{digest}.json.gz")
+
+
+_MEMO_LOCK = threading.Lock()
+_MEMO: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+
+def _memo_get(digest: str) -> Optional[str]:
+    with _MEMO_LOCK:
+        hit = _MEMO.get(digest)
+        if hit is None:
+            return None
+        if time.time() - hit[0] > OPENFDA_MEMO_TTL_S:
+            del _MEMO[digest]
+            return None
+        _MEMO.move_to_end(digest)
+        return hit[1]
+
+
+def _memo_put(digest: str, payload: str) -> None:
+    if OPENFDA_MEMO_SIZE <= 0:
+        return
+    with _MEMO_LOCK:
+        _MEMO[digest] = (time.time(), payload)
+        _MEMO.move_to_end(digest)
+        while len(_MEMO) > OPENFDA_MEMO_SIZE:
+            _MEMO.popitem(last=False)
+
+
+def _cache_read(path: str) -> Optional[str]:
     try:
-        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-            payload = resp.read().decode("utf-8")
-    except urllib.error.HTTPError as e:
-        raise RuntimeError(f"openFDA HTTP error {e.code}: {e.reason}") from e
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"openFDA request failed: {e.reason}") from e
+        if time.time() - os.path.getmtime(path) > OPENFDA_CACHE_TTL_S:
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, EOFError, zlib.error, UnicodeDecodeError):
+        return None
+
 
+def _cache_drop(path: str) -> None:
     try:
-        data = json.loads(payload)
-    except json.JSONDecodeError as e:
-        raise RuntimeError("openFDA response was not valid JSON") from e
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _cache_write(path: str, payload: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # Label JSON is highly repetitive, so gzip shrinks entries several-fold.
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _openfda_request(
+    base_url: str, params: Dict[str, Any], timeout_s: int = 30
+) -> Dict[str, Any]:
+    params = {k: v for k, v in params.items() if v is not None}
+    digest = _cache_key(base_url, params)
+    payload = _memo_get(digest)
+    from_memo = payload is not None
+    cache_path = _cache_path(digest) if OPENFDA_CACHE_DIR else None
+    data = None
+    if payload is None and cache_path:
+        payload = _cache_read(cache_path)
+        if payload is not None:
+            try:
+                data = _json_loads(payload)
+            except json.JSONDecodeError:
+                # Corrupt entry: drop it and refetch rather than fail until TTL
+                _cache_drop(cache_path)
+                payload = None
+    from_cache = payload is not None
+
+    if payload is None:
+        _RATE_LIMITER.acquire()
+        try:
+            resp = _HTTP_SESSION.get(base_url, params=params, timeout=timeout_s)
+        except requests.RequestException as e:
+            raise RuntimeError(f"openFDA request failed: {e}") from e
+        if resp.status_code >= 400:
+            raise RuntimeError(f"openFDA HTTP error {resp.status_code}: {resp.reason}")
+        payload = resp.content.decode("utf-8")
+
+    if data is None:
+        try:
+            data = _json_loads(payload)
+        except json.JSONDecodeError as e:
+            raise RuntimeError("openFDA response was not valid JSON") from e
 
     if isinstance(data, dict) and data.get("error"):
         err = data["error"]
         msg = err.get("message") if isinstance(err, dict) else str(err)
         raise RuntimeError(f"openFDA API error: {msg}")
 
+    if cache_path and not from_cache:
+        _cache_write(cache_path, payload)
+    if not from_memo:
+        _memo_put(digest, payload)
     return data
 
 
-def fetch_openfda_records(
+def _fetch_openfda_page(
     search: str,
     api_key: Optional[str] = None,
     base_url: str = OPENFDA_BASE_URL,
@@ -183,13 +372,29 @@ def fetch_openfda_records(
     skip: int = 0,
     sort: Optional[str] = None,
     timeout_s: int = 30,
-) -> List[Dict[str, Any]]:
+) -> Dict[str, Any]:
+    """Fetch one page and return the full payload (results + meta)."""
     limit = min(max(1, limit), OPENFDA_MAX_LIMIT)
     params = {"search": search, "limit": limit, "skip": skip, "sort": sort}
     if api_key:
         params["api_key"] = api_key
     data = _openfda_request(base_url, params, timeout_s=timeout_s)
-    return data.get("results", []) if isinstance(data, dict) else []
+    return data if isinstance(data, dict) else {}
+
+
+def fetch_openfda_records(
+    search: str,
+    api_key: Optional[str] = None,
+    base_url: str = OPENFDA_BASE_URL,
+    limit: int = 100,
+    skip: int = 0,
+    sort: Optional[str] = None,
+    timeout_s: int = 30,
+) -> List[Dict[str, Any]]:
+    data = _fetch_openfda_page(
+        search, api_key, base_url, limit=limit, skip=skip, sort=sort, timeout_s=timeout_s
+    )
+    return data.get("results", [])
 
 
 def iter_openfda_records(
@@ -201,11 +406,32 @@ def iter_openfda_records(
     sort: Optional[str] = None,
     pause_s: float = 0.0,
     timeout_s: int = 30,
+    max_workers: int = 4,
 ) -> Iterable[Dict[str, Any]]:
+    """
+    Yield records page by page, in API order.
+
+    The first page reports the total match count; once it is known the
+    remaining pages are independent, so up to `max_workers` of them are
+    requested concurrently. Passing `pause_s` (explicit pacing) or
+    `max_workers=1` keeps the strictly sequential behaviour.
+    """
     limit = min(max(1, limit), OPENFDA_MAX_LIMIT)
     fetched = 0
     skip = 0
 
+    def _page(page_skip: int, page_limit: int) -> Dict[str, Any]:
+        return _fetch_openfda_page(
+            search=search,
+            api_key=api_key,
+            base_url=base_url,
+            limit=page_limit,
+            skip=page_skip,
+            sort=sort,
+            timeout_s=timeout_s,
+        )
+
+    total = None
     while True:
         if max_records is not None and fetched >= max_records:
             return
@@ -216,15 +442,8 @@ def iter_openfda_records(
             if batch_limit <= 0:
                 return
 
-        results = fetch_openfda_records(
-            search=search,
-            api_key=api_key,
-            base_url=base_url,
-            limit=batch_limit,
-            skip=skip,
-            sort=sort,
-            timeout_s=timeout_s,
-        )
+        data = _page(skip, batch_limit)
+        results = data.get("results", [])
         if not results:
             return
 
@@ -237,26 +456,51 @@ def iter_openfda_records(
         skip += len(results)
         if len(results) < batch_limit:
             return
+
+        total = ((data.get("meta") or {}).get("results") or {}).get("total")
+        if total is not None and max_workers > 1 and not pause_s:
+            break
         if pause_s:
             time.sleep(pause_s)
 
+    # ── Concurrent tail: bounded window of in-flight page requests ──
+    target = int(total) if max_records is None else min(int(total), max_records)
+    skips = iter(range(skip, target, limit))
+    pending: deque = deque()
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _submit_next() -> None:
+        nxt = next(skips, None)
+        if nxt is not None:
+            n = min(limit, target - nxt)
+            pending.append((pool.submit(_page, nxt, n), n))
+
+    try:
+        for _ in range(max_workers):
+            _submit_next()
+        while pending:
+            future, expected = pending.popleft()
+            results = future.result().get("results", [])
+            _submit_next()
+            for rec in results:
+                yield rec
+            if len(results) < expected:
+                return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 
 def _write_jsonl(path: str, items: List[Any]) -> None:
     with open(path, "w", encoding="utf-8") as f:
-        for it in items:
-            if hasattr(it, "__dict__"):
-                f.write(json.dumps(asdict(it), ensure_ascii=False) + "\n")
-            else:
-                f.write(json.dumps(it, ensure_ascii=False) + "\n")
+        f.writelines(
+            json.dumps(asdict(it) if hasattr(it, "__dict__") else it, ensure_ascii=False) + "\n"
+            for it in items
+        )
 
 
 def _read_jsonl_chunks(path: str, cls):
-    out = []
     with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            obj = json.loads(line)
-            out.append(cls(**obj))
-    return out
+        return [cls(**_json_loads(line)) for line in f]
 
 
 def _build_faiss_ip(vectors: np.ndarray):
@@ -287,11 +531,14 @@ def build_artifacts(
     api_sort: Optional[str] = None,
     api_pause_s: float = 0.0,
     api_timeout_s: int = 30,
+    api_workers: int = 4,
 ) -> Dict[str, Any]:
     if not api_search:
         raise ValueError("api_search is required for openFDA ingestion.")
 
     blocklist = set(field_blocklist or [])
+    # Membership is tested for every field of every record; use a set.
+    allowlist = frozenset(field_allowlist) if field_allowlist else None
     record_chunks: List[TextChunk] = []
     records_count = 0
 
@@ -304,10 +551,11 @@ def build_artifacts(
         sort=api_sort,
         pause_s=api_pause_s,
         timeout_s=api_timeout_s,
+        max_workers=api_workers,
     ):
         doc_id = derive_doc_id(rec, records_count)
         for field, text in pick_text_fields(
-            rec, field_allowlist, blocklist, include_table_fields
+            rec, allowlist, blocklist, include_table_fields
         ).items():
             if len(text) < min_chars:
                 continue
@@ -346,15 +594,13 @@ def build_artifacts(
     elif texts_A:
         embedder_type = "tfidf"
         tfidf_vec = TfidfVectorizer(max_features=50000, ngram_range=(1, 2))
-        combined = texts_A + texts_B
-        tfidf_vec.fit(combined)
+        # One pass over the corpus: fit_transform already yields L2-normalised
+        # rows (norm="l2"), so slice them instead of transforming twice more.
+        mat = tfidf_vec.fit_transform(texts_A + texts_B)
         vectorizer = tfidf_vec
-        vecs_A = normalize(tfidf_vec.transform(texts_A)).toarray().astype(np.float32)
-        vecs_B = (
-            normalize(tfidf_vec.transform(texts_B)).toarray().astype(np.float32)
-            if texts_B
-            else None
-        )
+        n_a = len(texts_A)
+        vecs_A = mat[:n_a].toarray().astype(np.float32)
+        vecs_B = mat[n_a:].toarray().astype(np.float32) if texts_B else None
 
     faiss_A = _build_faiss_ip(vecs_A) if vecs_A is not None and len(texts_A) else None
     faiss_B = _build_faiss_ip(vecs_B) if vecs_B is not None and len(texts_B) else None
@@ -390,6 +636,7 @@ def build_artifacts(
                 "max_records": api_max_records,
                 "pause_s": api_pause_s,
                 "timeout_s": api_timeout_s,
+                "workers": api_workers,
             },
         },
         "counts": {
@@ -449,12 +696,15 @@ def build_artifacts(
             json.dump(manifest, f, indent=2)
 
     if verbose:
-        print("Records:", records_count)
-        print("Text chunks:", len(record_chunks))
-        print("Sub-chunks:", len(sub_chunks))
-        print("Embedder:", embedder_type)
+        lines = [
+            f"Records: {records_count}",
+            f"Text chunks: {len(record_chunks)}",
+            f"Sub-chunks: {len(sub_chunks)}",
+            f"Embedder: {embedder_type}",
+        ]
         if save:
-            print("Artifacts saved to:", output_dir)
+            lines.append(f"Artifacts saved to: {output_dir}")
+        print("\n".join(lines))
 
     return {
         "record_chunks": record_chunks,
@@ -493,10 +743,10 @@ def load_artifacts(output_dir: str = "preprocessed", load_vectorizer: bool = Tru
         os.path.join(output_dir, "sub_chunks.jsonl"), SubChunk
     )
 
-    with open(os.path.join(output_dir, "bm25_record_tokens.json"), "r", encoding="utf-8") as f:
-        tokens_A = json.load(f)
-    with open(os.path.join(output_dir, "bm25_sub_tokens.json"), "r", encoding="utf-8") as f:
-        tokens_B = json.load(f)
+    with open(os.path.join(output_dir, "bm25_record_tokens.json"), "rb") as f:
+        tokens_A = _json_loads(f.read())
+    with open(os.path.join(output_dir, "bm25_sub_tokens.json"), "rb") as f:
+        tokens_B = _json_loads(f.read())
 
     bm25_A = BM25Okapi(tokens_A) if tokens_A else None
     bm25_B = BM25Okapi(tokens_B) if tokens_B else None
@@ -14,11 +14,14 @@ import re
 import csv
 import time
 import json
+import hashlib
+import threading
 import warnings
 import numpy as np
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 
 # ── Make sibling modules importable ──────────────────────────
 _SRC = Path(__file__).resolve().parent
@@ -61,6 +64,8 @@ API_BASE = "https://api.fda.gov/drug/label.json"
 DEFAULT_LIMIT = 20           # records per API page (keep small for cloud memory)
 DEFAULT_MAX_REC = 20         # total records to pull (enough for evidence, fits in 1GB)
 USE_SENTENCE_TRANSFORMERS = False   # False = TF-IDF (fast); True = dense (slow on CPU)
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_CACHE_SIZE = 128      # identical prompts (same question + evidence) reuse the answer
 
 # ── Logging paths ────────────────────────────────────────────
 _PROJECT_ROOT = _SRC.parent
@@ -119,10 +124,14 @@ def _dense(query, index, corpus, e_type, e_model, vec, k=15):
 
 def _sparse(query, bm25, corpus, k=15):
     """Sparse (BM25) keyword search."""
-    if bm25 is None or not corpus:
+    if bm25 is None or not corpus or k <= 0:
         return []
-    scores = bm25.get_scores(tokenize(query))
-    top = np.argsort(scores)[::-1][:k]
+    scores = np.asarray(bm25.get_scores(tokenize(query)))
+    if k < scores.size:
+        top = np.argpartition(scores, -k)[-k:]
+    else:
+        top = np.arange(scores.size)
+    top = top[np.argsort(scores[top])[::-1]]
     return [(float(scores[i]), corpus[int(i)]) for i in top]
 
 
@@ -183,20 +192,63 @@ def _build_prompt(question: str, evidence: list) -> str:
     )
 
 
-def _call_gemini(prompt: str, api_key: str) -> Optional[str]:
-    """Call Google Gemini for grounded answer generation. Returns None on failure."""
+_GEMINI_LOCK = threading.Lock()
+_GEMINI_CLIENT: Dict[str, Any] = {"key": None, "model": None}
+_GEMINI_ANSWER_CACHE: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _call_gemini(
+    prompt: str,
+    api_key: str,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> Optional[str]:
+    """
+    Call Google Gemini for grounded answer generation. Returns None on failure.
+    If on_token is given, the response is streamed and each text chunk is
+    passed to it as it arrives (cached answers are returned without streaming).
+    """
+    cache_key = hashlib.sha256(f"{GEMINI_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+    with _GEMINI_LOCK:
+        cached = _GEMINI_ANSWER_CACHE.get(cache_key)
+        if cached is not None:
+            _GEMINI_ANSWER_CACHE.move_to_end(cache_key)
+            return cached
     try:
         import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        if resp and resp.text:
-            return resp.text.strip()
+        with _GEMINI_LOCK:
+            # Re-configure only when the key changes; the model object is reused.
+            if _GEMINI_CLIENT["key"] != api_key:
+                genai.configure(api_key=api_key)
+                _GEMINI_CLIENT["model"] = genai.GenerativeModel(GEMINI_MODEL)
+                _GEMINI_CLIENT["key"] = api_key
+            model = _GEMINI_CLIENT["model"]
+        if on_token is not None:
+            parts = []
+            for chunk in model.generate_content(prompt, stream=True):
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    on_token(text)
+            answer = "".join(parts).strip()
+        else:
+            resp = model.generate_content(prompt)
+            answer = resp.text.strip() if resp and resp.text else ""
+        if answer:
+            with _GEMINI_LOCK:
+                _GEMINI_ANSWER_CACHE[cache_key] = answer
+                while len(_GEMINI_ANSWER_CACHE) > GEMINI_CACHE_SIZE:
+                    _GEMINI_ANSWER_CACHE.popitem(last=False)
+            return answer
     except Exception as exc:
         warnings.warn(f"Gemini error: {exc}")
     return None
 
 
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_DIGIT_RE = re.compile(r"\d")
+_CITE_RE = re.compile(r"\[.*?\]")
+
+
 def _fallback_answer(question: str, evidence: list, n: int = 5) -> str:
     """
     Extractive fallback answer generator — no external LLM required.
@@ -213,13 +265,13 @@ def _fallback_answer(question: str, evidence: list, n: int = 5) -> str:
     cands = []
     for e in evidence:
         cite = e["cite"]
-        for sent in re.split(r"(?<=[.!?])\s+|\n+", (e.get("content") or "")):
+        for sent in _SENT_SPLIT_RE.split(e.get("content") or ""):
             sent = sent.strip()
             if len(sent) < 30:
                 continue
             s_tok = set(tokenize(sent))
             overlap = len(q_tok & s_tok)
-            bonus = 2 if re.search(r"\d", sent) else 0
+            bonus = 2 if _DIGIT_RE.search(sent) else 0
             cands.append((overlap + bonus, sent, cite))
 
     cands.sort(key=lambda x: x[0], reverse=True)
@@ -245,7 +297,7 @@ def _confidence(evidence: list, answer: str) -> float:
     if "Not enough evidence" in answer:
         return 0.0
     n = len(evidence)
-    cites = len(re.findall(r"\[.*?\]", answer))
+    cites = len(_CITE_RE.findall(answer))
     return round(min(1.0, 0.30 + 0.08 * n + 0.04 * cites), 2)
 
 
@@ -253,6 +305,9 @@ def _confidence(evidence: list, answer: str) -> float:
 #  CSV LOGGING
 # ══════════════════════════════════════════════════════════════
 
+_LOG_LOCK = threading.Lock()
+
+
 def _ensure_log():
     """Create the log directory and CSV header if they don't exist."""
     LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -263,19 +318,40 @@ def _ensure_log():
 
 def log_row(row: Dict[str, Any]):
     """Append one interaction row to the product metrics CSV."""
-    _ensure_log()
-    with open(LOG_CSV, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=LOG_COLS)
-        w.writerow({k: row.get(k, "") for k in LOG_COLS})
+    # One lock covers the header check and the append, so concurrent
+    # sessions can neither interleave rows nor both write a header.
+    with _LOG_LOCK:
+        _ensure_log()
+        with open(LOG_CSV, "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=LOG_COLS)
+            w.writerow({k: row.get(k, "") for k in LOG_COLS})
+
+
+def log_result(query: str, result: Dict[str, Any]):
+    """Log a run_rag_query result dict as one interaction row."""
+    answer = result.get("answer") or ""
+    log_row({
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "query": query[:200],
+        "latency_ms": result["latency_ms"],
+        "evidence_ids": "; ".join(e["cite"] for e in result["evidence"]),
+        "confidence": result["confidence"],
+        "num_evidence": len(result["evidence"]),
+        "num_records": result["num_records"],
+        "retrieval_method": result["method"],
+        "llm_used": result["llm_used"],
+        "answer_preview": answer[:150],
+    })
 
 
 def read_logs(last_n: int = 20) -> List[Dict[str, str]]:
     """Read the most recent log rows for display."""
     if not LOG_CSV.exists():
         return []
+    if last_n <= 0:
+        return []
     with open(LOG_CSV, "r", encoding="utf-8") as f:
-        rows = list(csv.DictReader(f))
-    return rows[-last_n:]
+        return list(deque(csv.DictReader(f), maxlen=last_n))
 
 
 # ══════════════════════════════════════════════════════════════
@@ -291,11 +367,16 @@ def run_rag_query(
     use_rerank: bool = False,
     api_limit: int = DEFAULT_LIMIT,
     max_records: int = DEFAULT_MAX_REC,
+    on_token: Optional[Callable[[str], None]] = None,
+    log: bool = True,
 ) -> Dict[str, Any]:
     """
     End-to-end RAG pipeline:
       openFDA API fetch  ->  chunk  ->  index  ->  retrieve  ->  generate  ->  log
 
+    on_token, if given, receives Gemini answer chunks as they stream in.
+    log=False skips the CSV row so a caching caller can log each hit itself.
+
     Returns dict with: answer, evidence, latency_ms, confidence, num_records,
                        search_query, prompt, llm_used, method
     """
@@ -327,19 +408,7 @@ def run_rag_query(
             err_answer = "Not enough evidence in the retrieved context."
         else:
             err_answer = f"Error fetching data from openFDA: {exc}"
-        log_row({
-            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "query": query[:200],
-            "latency_ms": lat,
-            "evidence_ids": "",
-            "confidence": 0.0,
-            "num_evidence": 0,
-            "num_records": 0,
-            "retrieval_method": method,
-            "llm_used": False,
-            "answer_preview": err_answer[:150],
-        })
-        return {
+        result = {
             "answer": err_answer,
             "evidence": [],
             "latency_ms": lat,
@@ -350,6 +419,9 @@ def run_rag_query(
             "llm_used": False,
             "method": method,
         }
+        if log:
+            log_result(query, result)
+        return result
 
     corpus = arts["record_chunks"]
     index = arts["faiss_A"]
@@ -398,7 +470,7 @@ def run_rag_query(
     answer = None
 
     if gemini_key:
-        answer = _call_gemini(prompt, gemini_key)
+        answer = _call_gemini(prompt, gemini_key, on_token=on_token)
         if answer:
             llm_used = True
 
@@ -409,22 +481,7 @@ def run_rag_query(
     conf = _confidence(evidence, answer)
     lat = round((time.time() - t0) * 1000, 1)
 
-    # 8 ── Log interaction to CSV
-    ev_ids = [e["cite"] for e in evidence]
-    log_row({
-        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "query": query[:200],
-        "latency_ms": lat,
-        "evidence_ids": "; ".join(ev_ids),
-        "confidence": conf,
-        "num_evidence": len(evidence),
-        "num_records": n_recs,
-        "retrieval_method": method,
-        "llm_used": llm_used,
-        "answer_preview": (answer or "")[:150],
-    })
-
-    return {
+    result = {
         "answer": answer,
         "evidence": evidence,
         "latency_ms": lat,
@@ -435,3 +492,8 @@ def run_rag_query(
         "llm_used": llm_used,
         "method": method,
     }
+
+    # 8 ── Log interaction to CSV
+    if log:
+        log_result(query, result)
+    return result